@@ -1,16 +1,28 @@
 # app.py
 import streamlit as st
-import PyPDF2
-from elevenlabs import generate, voices, set_api_key, Voice
+import pypdfium2
+from elevenlabs import voices, set_api_key, Voice
 import os
 from pathlib import Path
 import tempfile
-from datetime import datetime
+import shutil
+from contextlib import closing, contextmanager
 import time
 import json
-from typing import List
+from typing import Dict, Iterable, Iterator, List, MutableMapping, Optional, Tuple
 import logging
 import traceback
+import threading
+import itertools
+import hashlib
+import re
+import io
+import zipfile
+import diskcache
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
+import aiohttp
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential, wait_random
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -41,120 +53,573 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+TTS_MODEL = "eleven_turbo_v2"  # lower server-side latency than eleven_monolingual_v1
+ELEVENLABS_API_URL = "https://api.elevenlabs.io/v1"
+MAX_REQUEST_CHARS = 4000  # stays under the ElevenLabs per-request character limit
+SEGMENTS_PER_PAGE = 10
+MAX_CONCURRENT_REQUESTS = 5  # upper bound of the "Concurrent requests" slider
+PREFETCH = 3  # parts generated ahead of the one being played
+PROGRESS_INTERVAL = 0.1  # seconds; each UI update is a websocket round-trip
+
+# A sentence ends after its terminator(s), any closing quotes/brackets and the following
+# whitespace. Only the boundary is matched, and the lookbehind keeps the scan linear.
+_SENTENCE_END_RE = re.compile(r'(?<![.!?])[.!?]+["\')\]]*(?:\s+|$)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# PDFium is not thread-safe, even across documents, and Streamlit sessions run in separate threads
+_PDFIUM_LOCK = threading.Lock()
+
+def _audio_cache_key(voice_id: str, text: str, streaming_latency: int) -> tuple:
+    """Identical text with the same voice, model and latency setting always yields the same audio."""
+    digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    return (voice_id, TTS_MODEL, streaming_latency, digest)
+
 class RateLimit:
-    def __init__(self, max_requests: int, time_window: int):
-        self.max_requests = max_requests
-        self.time_window = time_window
-        self.requests = []
-
-    def is_allowed(self) -> bool:
-        now = datetime.now().timestamp()
-        self.requests = [req for req in self.requests 
-                        if now - req < self.time_window]
-        
-        if len(self.requests) >= self.max_requests:
-            return False
+    """Token bucket limiter shared by concurrent TTS requests."""
+    def __init__(self, capacity: int, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate  # tokens per second
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.last_refill) * self.refill_rate)
+            self.last_refill = now
             
-        self.requests.append(now)
-        return True
+            # Tokens may go negative: later callers queue up behind earlier ones
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.refill_rate
+
+def _is_rate_limit(e: BaseException) -> bool:
+    """Check whether an ElevenLabs error is worth retrying."""
+    message = str(e).lower()
+    return any(marker in message for marker in ("429", "rate limit", "quota"))
+
+def new_rate_limiter() -> RateLimit:
+    """Bursts of 3, then 2 requests/sec."""
+    return RateLimit(capacity=3, refill_rate=2.0)
 
 class PDFAudioReader:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, max_concurrent: int = 3, audio_cache: Optional[MutableMapping] = None,
+                 max_request_chars: int = MAX_REQUEST_CHARS, streaming_latency: int = 3,
+                 executor: Optional[ThreadPoolExecutor] = None, rate_limiter: Optional[RateLimit] = None,
+                 tts_executor: Optional[ThreadPoolExecutor] = None):
         """Initialize the PDF to Audio converter."""
         self.api_key = api_key
         set_api_key(api_key)
-        self.rate_limiter = RateLimit(max_requests=10, time_window=3600)  # 10 requests per hour
+        # Pass a shared limiter so pacing holds across conversions and sessions using the same key
+        self.rate_limiter = rate_limiter if rate_limiter is not None else new_rate_limiter()
+        self.max_concurrent = max_concurrent
+        self.audio_cache = audio_cache if audio_cache is not None else {}
+        self.max_request_chars = max_request_chars
+        self.streaming_latency = streaming_latency
+        # PDF parsing and chunking; None falls back to the event loop's default executor
+        self.executor = executor
+        # Blocking TTS requests, kept apart so slow network calls never hold up extraction
+        self.tts_executor = tts_executor if tts_executor is not None else ThreadPoolExecutor(
+            max_workers=max_concurrent, thread_name_prefix="tts"
+        )
+        
+        # Extraction progress, updated from the thread that parses the PDF
+        self.pages_extracted = 0
+        self.total_pages = 0
         
     @staticmethod
     def validate_pdf(file) -> bool:
-        """Validate PDF file."""
+        """Cheaply check for the PDF header and end-of-file marker; parsing happens on extraction."""
+        pos = file.tell()
         try:
-            PyPDF2.PdfReader(file)
-            return True
-        except:
-            return False
+            file.seek(0)
+            head = file.read(5)
+            size = file.seek(0, 2)
+            file.seek(max(0, size - 1024))
+            tail = file.read(1024)
+        finally:
+            file.seek(pos)
+        return head == b'%PDF-' and b'%%EOF' in tail
             
-    def extract_text_from_pdf(self, pdf_file) -> str:
-        """Extract text from a PDF file object."""
+    def iter_page_texts(self, pdf_file, pages: Optional[List[Tuple[int, int]]] = None) -> Iterator[str]:
+        """Yield the text of each page of a PDF (path or file object), optionally only the given page ranges."""
         try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            total_pages = len(pdf_reader.pages)
+            with _PDFIUM_LOCK:
+                pdf = pypdfium2.PdfDocument(pdf_file)
+                page_count = len(pdf)
+        except Exception as e:
+            logger.error(f"PDF extraction error: {str(e)}\n{traceback.format_exc()}")
+            raise Exception("Error reading PDF. Please ensure it's a valid PDF file.")
             
-            # Add progress bar for text extraction
-            progress_text = st.empty()
-            progress_bar = st.progress(0)
+        try:
+            page_indices = range(page_count)
+            if pages is not None:
+                page_indices = sorted({i for first, last in pages
+                                       for i in range(first, min(last, page_count))})
+            self.total_pages = len(page_indices)
             
-            for i, page in enumerate(pdf_reader.pages):
-                text += page.extract_text() + "\n"
-                progress_bar.progress((i + 1) / total_pages)
-                progress_text.text(f"Extracting text: page {i + 1}/{total_pages}")
-                
-            progress_text.empty()
-            progress_bar.empty()
+            for n, i in enumerate(page_indices, 1):
+                self.pages_extracted = n
+                # Hold the lock per page only, so other sessions can interleave
+                with _PDFIUM_LOCK:
+                    page = pdf[i]
+                    
+                    # Pages without any objects are blank; skip the text extraction
+                    if next(page.get_objects(max_depth=1), None) is None:
+                        page_text = None
+                    else:
+                        textpage = page.get_textpage()
+                        page_text = textpage.get_text_range()
+                        textpage.close()
+                    page.close()
+                    
+                if page_text is not None:
+                    yield page_text
             
-            return text
         except Exception as e:
             logger.error(f"PDF extraction error: {str(e)}\n{traceback.format_exc()}")
             raise Exception("Error reading PDF. Please ensure it's a valid PDF file.")
+        finally:
+            with _PDFIUM_LOCK:
+                pdf.close()
     
     def chunk_text(self, text: str, max_chars: int = 2000) -> List[str]:
-        """Split text into smaller chunks."""
-        sentences = text.replace('\n', ' ').split('. ')
+        """Split text into chunks of at most max_chars, breaking between sentences where possible."""
+        text = _WHITESPACE_RE.sub(' ', text).strip()
         chunks = []
-        current_chunk = []
-        current_length = 0
+        start = last_end = 0
         
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
+        # Greedily pack sentences; chunks are sliced from the text only when emitted
+        ends = itertools.chain((m.end() for m in _SENTENCE_END_RE.finditer(text)), (len(text),))
+        for end in ends:
+            if end - start > max_chars:
+                if last_end > start:
+                    chunks.append(text[start:last_end].rstrip())
+                    start = last_end
+                    
+                # A sentence longer than max_chars is split at the last space that fits,
+                # or at max_chars when there is none (e.g. unpunctuated CJK text)
+                while end - start > max_chars:
+                    cut = text.rfind(' ', start + 1, start + max_chars + 1)
+                    cut = cut + 1 if cut != -1 else start + max_chars
+                    chunks.append(text[start:cut].rstrip())
+                    start = cut
+            last_end = end
+            
+        if last_end > start:
+            chunks.append(text[start:last_end].rstrip())
+            
+        return chunks
+    
+    def iter_chunks(self, page_iter: Iterable[str], max_chars: int = 2000) -> Iterator[str]:
+        """Chunk page texts as they arrive instead of waiting for the whole document."""
+        buffer = ""
+        for page_text in page_iter:
+            buffer += page_text + "\n"
+            if len(buffer) <= max_chars:
                 continue
                 
-            if current_length + len(sentence) + 2 <= max_chars:
-                current_chunk.append(sentence)
-                current_length += len(sentence) + 2
+            # The last chunk may end mid-sentence, so carry it over to the next page
+            chunks = self.chunk_text(buffer, max_chars)
+            yield from chunks[:-1]
+            buffer = chunks[-1] + " " if chunks else ""
+            
+        yield from self.chunk_text(buffer, max_chars)
+    
+    def _split_oversize(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Re-chunk anything longer than max_request_chars so no request exceeds the API limit."""
+        for chunk in chunks:
+            if len(chunk) > self.max_request_chars:
+                yield from self.chunk_text(chunk, self.max_request_chars)
             else:
-                if current_chunk:
-                    chunks.append('. '.join(current_chunk) + '.')
-                current_chunk = [sentence]
-                current_length = len(sentence)
+                yield chunk
+    
+    def iter_request_groups(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Merge consecutive chunks so each API request carries up to max_request_chars."""
+        # One buffer for the whole run, joined once per emitted group
+        parts = []
+        length = 0
+        for chunk in self._split_oversize(chunks):
+            if parts and length + 1 + len(chunk) > self.max_request_chars:
+                yield " ".join(parts)
+                parts.clear()
+                length = 0
+            length += len(chunk) + 1 if parts else len(chunk)
+            parts.append(chunk)
                 
-        if current_chunk:
-            chunks.append('. '.join(current_chunk) + '.')
-            
-        return chunks
+        if parts:
+            yield " ".join(parts)
     
-    def text_to_speech(self, text: str, voice: str, progress_bar) -> List[bytes]:
-        """Convert text chunks to speech."""
-        if not self.rate_limiter.is_allowed():
-            raise Exception("Rate limit exceeded. Please try again later.")
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(min=1, max=30) + wait_random(0, 2),
+        retry=retry_if_exception(_is_rate_limit),
+        reraise=True
+    )
+    async def _request_audio(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                             text: str, voice_id: str) -> bytes:
+        """Generate audio for one request group via the ElevenLabs streaming endpoint."""
+        async with semaphore:
+            await asyncio.sleep(self.rate_limiter.reserve())
             
-        chunks = self.chunk_text(text)
+            # Streaming returns bytes while the rest is still being synthesized
+            async with session.post(
+                f"{ELEVENLABS_API_URL}/text-to-speech/{voice_id}/stream",
+                params={"optimize_streaming_latency": self.streaming_latency},
+                json={"text": text, "model_id": TTS_MODEL},
+                headers={"xi-api-key": self.api_key, "accept": "audio/mpeg"}
+            ) as response:
+                if response.status >= 400:
+                    raise Exception(f"ElevenLabs API error {response.status}: {await response.text()}")
+                audio = bytearray()
+                async for part in response.content.iter_chunked(16384):
+                    audio += part
+                return bytes(audio)
+
+    async def _tts_pipeline(self, chunks: Iterable[str], voice_id: str,
+                            progress_bar, status) -> List[Optional[bytes]]:
+        """Overlap PDF extraction (in a worker thread) with concurrent TTS requests."""
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        # Fewer, larger requests keep us well under the requests-per-minute quota
+        groups = self.iter_request_groups(chunks)
         audio_segments = []
+        pending = {}  # task -> (segment index, cache key)
+        done_count = 0
+        last_update = 0.0
         
-        for i, chunk in enumerate(chunks):
-            try:
-                progress_bar.progress((i + 1) / len(chunks))
+        def report_progress(force: bool = False):
+            nonlocal last_update
+            now = time.monotonic()
+            if not force and now - last_update < PROGRESS_INTERVAL:
+                return
+            last_update = now
+            
+            progress_bar.progress(done_count / len(audio_segments) if audio_segments else 1.0)
+            label = f"Generated {done_count}/{len(audio_segments)} audio segments"
+            if 0 < self.pages_extracted < self.total_pages:
+                label += f" · extracting page {self.pages_extracted}/{self.total_pages}"
+            status.update(label=label)
+        
+        def collect(finished):
+            nonlocal done_count
+            for task in finished:
+                i, key = pending.pop(task)
+                try:
+                    audio_segments[i] = self.audio_cache[key] = task.result()
+                except Exception as e:
+                    # Keep going so the audio generated so far isn't lost
+                    logger.error(f"Audio generation error: {str(e)}\n{traceback.format_exc()}")
+                done_count += 1
+            report_progress()
+        
+        async with aiohttp.ClientSession() as session:
+            while True:
+                # Parsing is CPU-bound, so run it off the event loop
+                group = await loop.run_in_executor(self.executor, next, groups, None)
+                if group is None:
+                    break
+                    
+                # Only chunks that changed since the last conversion hit the API
+                key = _audio_cache_key(voice_id, group, self.streaming_latency)
+                cached = self.audio_cache.get(key)
+                if cached is not None:
+                    audio_segments.append(cached)
+                    done_count += 1
+                    continue
+                    
+                audio_segments.append(None)
+                task = asyncio.create_task(self._request_audio(session, semaphore, group, voice_id))
+                pending[task] = (len(audio_segments) - 1, key)
                 
-                audio = generate(
-                    text=chunk,
-                    voice=voice,
-                    model="eleven_monolingual_v1"
-                )
+                # Stop pulling pages while the backlog is full to keep memory bounded
+                if len(pending) >= self.max_concurrent * 2:
+                    finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    collect(finished)
+                else:
+                    collect([task for task in pending if task.done()])
+            
+            # Results are stored at their segment index, so order is preserved
+            while pending:
+                finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                collect(finished)
                 
-                audio_segments.append(audio)
-                time.sleep(0.5)  # Rate limiting
+        report_progress(force=True)
+        return audio_segments
+
+    def synthesize(self, text: str, voice_id: str) -> bytes:
+        """Generate audio for a single request group outside the batch pipeline."""
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                return await self._request_audio(session, asyncio.Semaphore(1), text, voice_id)
                 
+        key = _audio_cache_key(voice_id, text, self.streaming_latency)
+        audio = self.audio_cache.get(key)
+        if audio is None:
+            audio = self.audio_cache[key] = asyncio.run(run())
+        return audio
+
+    def text_to_speech(self, chunks: Iterable[str], voice_id: str,
+                       progress_bar, status) -> List[Optional[bytes]]:
+        """Convert text chunks to speech, one segment per request group. Failed groups are returned as None."""
+        return asyncio.run(self._tts_pipeline(chunks, voice_id, progress_bar, status))
+
+@st.cache_resource
+def get_extraction_executor() -> ThreadPoolExecutor:
+    """Share one pool for PDF parsing across reruns and sessions; PDFium is serialized anyway."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="pdf")
+
+@st.cache_resource
+def get_tts_executor(api_key: str) -> ThreadPoolExecutor:
+    """One pool of TTS request threads per API key, as wide as the most requests a session may run at once."""
+    return ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="tts")
+
+@st.cache_resource
+def get_rate_limiter(api_key: str) -> RateLimit:
+    """One token bucket per API key, shared by every session and rerun."""
+    return new_rate_limiter()
+
+@st.cache_resource
+def get_audio_cache() -> diskcache.Cache:
+    """On-disk audio cache shared by all sessions, so re-uploaded or edited PDFs reuse unchanged parts."""
+    return diskcache.Cache(".audio_cache")
+
+def _sha256_stream(f, block: int = 65536) -> str:
+    """Hash a file object in fixed-size blocks instead of reading it into one bytes object."""
+    if hasattr(hashlib, "file_digest"):  # Python 3.11+
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+    else:
+        h = hashlib.sha256()
+        while data := f.read(block):
+            h.update(data)
+        digest = h.hexdigest()
+    f.seek(0)
+    return digest
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_voices(api_key: str) -> Dict[str, str]:
+    """Fetch the available voices as a name -> voice_id mapping, cached per API key."""
+    return {voice.name: voice.voice_id for voice in voices()}
+
+def parse_page_range(spec: str) -> Optional[List[Tuple[int, int]]]:
+    """Parse a page selection like "10-50, 80" into 0-based, end-exclusive ranges. Empty means all pages.
+    
+    Ranges are kept as bounds, not expanded, since they are only clamped to the page count on extraction.
+    """
+    if not spec.strip():
+        return None
+        
+    pages = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition('-')
+        try:
+            first = int(start)
+            last = int(end) if sep else first
+        except ValueError:
+            raise ValueError(f"Invalid page range: '{part}'")
+        if first < 1 or last < first:
+            raise ValueError(f"Invalid page range: '{part}'")
+        pages.append((first - 1, last))
+        
+    return sorted(set(pages))
+
+@contextmanager
+def _spill_to_disk(uploaded_file) -> Iterator[str]:
+    """Copy an upload to a temporary file so PDFium reads it by path, paging it in from disk."""
+    tf = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+    try:
+        # Unlink even if the copy itself fails (e.g. disk full)
+        with tf:
+            uploaded_file.seek(0)
+            shutil.copyfileobj(uploaded_file, tf, length=1 << 20)
+        uploaded_file.seek(0)
+        yield tf.name
+    finally:
+        os.unlink(tf.name)
+
+def _iter_cached_pages(reader: PDFAudioReader, pdf_file, digest: str, page_cache: dict,
+                       pages: Optional[List[Tuple[int, int]]] = None) -> Iterator[str]:
+    """Replay page texts for a PDF that was already extracted, otherwise extract and remember them.
+    
+    Takes the cache dict explicitly because it's consumed off the script thread,
+    where st.session_state isn't available.
+    """
+    cache_key = (digest, tuple(pages) if pages is not None else None)
+    if cache_key in page_cache:
+        yield from page_cache[cache_key]
+        return
+        
+    page_texts = []
+    with _spill_to_disk(pdf_file) as pdf_path, \
+            closing(reader.iter_page_texts(pdf_path, pages)) as page_iter:
+        for page_text in page_iter:
+            page_texts.append(page_text)
+            yield page_text
+        
+    # Only keep the most recent document around
+    page_cache.clear()
+    page_cache[cache_key] = page_texts
+
+def build_audio_zip(file_name: str, audio_segments: List[Optional[bytes]]) -> dict:
+    """Bundle all generated parts into one in-memory ZIP.
+    
+    The ZIP is the only copy kept; single parts are read back out of it for display.
+    Returns the archive and the member name of each part (None for failed parts).
+    """
+    buffer = io.BytesIO()
+    parts = []
+    # MP3 is already compressed, so store the parts as-is
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for i, audio in enumerate(audio_segments, 1):
+            if audio is None:
+                parts.append(None)
+                continue
+            name = f"{file_name}_part_{i}.mp3"
+            archive.writestr(name, audio)
+            parts.append(name)
+    return {"zip": buffer.getvalue(), "parts": parts}
+
+def render_audio_segments(file_name: str, result: dict):
+    """Display audio players and download buttons, a page of segments at a time."""
+    parts = result["parts"]
+    failed = sum(name is None for name in parts)
+    st.success(f"Created {len(parts) - failed} audio segments!")
+    if failed:
+        st.warning(f"{failed} segment(s) could not be generated and were skipped.")
+        
+    st.download_button(
+        "Download all as ZIP",
+        result["zip"],
+        file_name=f"{file_name}_audio.zip",
+        mime="application/zip"
+    )
+    
+    # Each player is a heavy widget, so only send one page of them to the browser
+    start = 0
+    if len(parts) > SEGMENTS_PER_PAGE:
+        page_starts = range(0, len(parts), SEGMENTS_PER_PAGE)
+        start = st.selectbox(
+            "Show parts:",
+            page_starts,
+            format_func=lambda s: f"{s + 1}–{min(s + SEGMENTS_PER_PAGE, len(parts))}"
+        )
+        
+    with zipfile.ZipFile(io.BytesIO(result["zip"])) as archive:
+        for i in range(start, min(start + SEGMENTS_PER_PAGE, len(parts))):
+            if parts[i] is None:
+                continue
+            audio = archive.read(parts[i])
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.audio(audio, format="audio/mp3")
+            with col2:
+                st.download_button(
+                    f"Download Part {i + 1}",
+                    audio,
+                    file_name=parts[i],
+                    mime="audio/mp3"
+                )
+
+def _extract_groups(reader: PDFAudioReader, chunks: Iterable[str], groups: List[str]):
+    """Fill groups in the background so playback can start with the first part."""
+    for group in reader.iter_request_groups(chunks):
+        groups.append(group)
+
+def prefetch_segments(reader: PDFAudioReader, playback: dict):
+    """Collect finished parts and keep up to PREFETCH parts after the current one in flight.
+    
+    The current part is always submitted; the parts after it are limited to
+    reader.max_concurrent in flight, as in batch conversion.
+    """
+    pending = playback["pending"]  # part index -> Future
+    for i, future in list(pending.items()):
+        if future.done():
+            del pending[i]
+            try:
+                playback["audio"][i] = future.result()
             except Exception as e:
                 logger.error(f"Audio generation error: {str(e)}\n{traceback.format_exc()}")
-                raise Exception(f"Error generating audio: {str(e)}")
+                playback["audio"][i] = None
                 
-        return audio_segments
+    current = playback["current"]
+    groups = playback["groups"]
+    for i in range(current, min(current + PREFETCH + 1, len(groups))):
+        if i > current and len(pending) >= reader.max_concurrent:
+            break
+        if i not in playback["audio"] and i not in pending:
+            pending[i] = reader.tts_executor.submit(reader.synthesize, groups[i], playback["voice_id"])
+
+def render_playback(reader: PDFAudioReader, file_name: str, playback: dict):
+    """Play parts one at a time while the following parts are generated in the background."""
+    prefetch_segments(reader, playback)
+    current = playback["current"]
+    groups = playback["groups"]
+    extraction = playback["extraction"]
+    
+    if current >= len(groups) and not extraction.done():
+        with st.spinner(f"Extracting text for part {current + 1}..."):
+            wait([extraction], timeout=0.5)
+        st.rerun()
+        
+    if current < len(groups) and current not in playback["audio"]:
+        # Not finished yet; a part that is not in flight either gets submitted on the rerun
+        with st.spinner(f"Generating part {current + 1}..."):
+            if current in playback["pending"]:
+                wait([playback["pending"][current]])
+        # prefetch_segments picks up the result, or records a failure as None
+        st.rerun()
+        
+    # iter_page_texts already logged the extraction failure
+    if extraction.done() and extraction.exception() is not None:
+        st.error(f"Error: {str(extraction.exception())}")
+        
+    if current < len(groups):
+        total = f"{len(groups)}" if extraction.done() else f"{len(groups)}+"
+        st.write(f"Part {current + 1} of {total}")
+        audio = playback["audio"][current]
+        if audio is None:
+            st.warning("This part could not be generated.")
+        else:
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.audio(audio, format="audio/mp3")
+            with col2:
+                st.download_button(
+                    f"Download Part {current + 1}",
+                    audio,
+                    file_name=f"{file_name}_part_{current + 1}.mp3",
+                    mime="audio/mp3"
+                )
+    elif not groups and extraction.exception() is None:
+        st.warning("No text could be extracted from this PDF.")
+            
+    def move(step: int):
+        playback["current"] = current + step
+        
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("Previous part", disabled=current == 0, on_click=move, args=(-1,))
+    with col2:
+        st.button("Next part", disabled=current + 1 >= len(groups) and extraction.done(),
+                  on_click=move, args=(1,))
 
 def initialize_session_state():
     """Initialize session state variables."""
     if 'processed_files' not in st.session_state:
         st.session_state.processed_files = {}
+    if 'upload_info' not in st.session_state:
+        st.session_state.upload_info = {}
+    if 'playback' not in st.session_state:
+        st.session_state.playback = {}
+    if 'page_texts' not in st.session_state:
+        st.session_state.page_texts = {}
     if 'api_key' not in st.session_state:
         st.session_state.api_key = os.getenv('ELEVENLABS_API_KEY', '')
 
@@ -176,8 +641,31 @@ def main():
         st.warning("Please enter your ElevenLabs API key to continue.")
         return
         
+    max_concurrent = st.slider(
+        "Concurrent requests:",
+        min_value=1,
+        max_value=MAX_CONCURRENT_REQUESTS,
+        value=3,
+        help="Number of audio segments generated in parallel"
+    )
+    streaming_latency = st.slider(
+        "Latency vs quality:",
+        min_value=0,
+        max_value=4,
+        value=3,
+        help="Higher values start streaming audio sooner at some cost in quality"
+    )
+        
     try:
-        reader = PDFAudioReader(api_key)
+        reader = PDFAudioReader(
+            api_key,
+            max_concurrent=max_concurrent,
+            audio_cache=get_audio_cache(),
+            streaming_latency=streaming_latency,
+            executor=get_extraction_executor(),
+            rate_limiter=get_rate_limiter(api_key),
+            tts_executor=get_tts_executor(api_key)
+        )
         
         # File upload
         uploaded_file = st.file_uploader(
@@ -193,11 +681,23 @@ def main():
             }
             
             st.write("File Details:", file_details)
+            # Check and hash each upload once, not on every rerun
+            if st.session_state.upload_info.get("file_id") != uploaded_file.file_id:
+                is_valid = reader.validate_pdf(uploaded_file)
+                st.session_state.upload_info = {
+                    "file_id": uploaded_file.file_id,
+                    "is_valid": is_valid,
+                    "digest": _sha256_stream(uploaded_file) if is_valid else None
+                }
+            if not st.session_state.upload_info["is_valid"]:
+                st.error("This doesn't look like a valid PDF file.")
+                return
+            digest = st.session_state.upload_info["digest"]
             
             # Voice selection
             try:
-                available_voices = voices()
-                voice_names = [voice.name for voice in available_voices]
+                voice_ids = _cached_voices(api_key)
+                voice_names = list(voice_ids)
                 selected_voice = st.selectbox(
                     "Select a voice:",
                     voice_names,
@@ -207,49 +707,83 @@ def main():
                 st.error("Error fetching voices. Please check your API key.")
                 return
             
+            # Page selection
+            try:
+                pages = parse_page_range(st.text_input(
+                    "Pages (e.g. 10-50, 80):",
+                    help="Leave empty to convert the whole document"
+                ))
+            except ValueError as e:
+                st.error(str(e))
+                return
+            
+            play_while_generating = st.checkbox(
+                "Play while generating",
+                help=f"Start listening right away; the next {PREFETCH} parts are generated ahead of the player"
+            )
+            
             # Convert button
             if st.button("Convert to Audio", type="primary"):
                 try:
                     with st.spinner("Processing..."):
-                        # Extract text
-                        text = reader.extract_text_from_pdf(uploaded_file)
-                        st.success("Text extracted successfully!")
+                        if play_while_generating:
+                            chunks = reader.iter_chunks(_iter_cached_pages(
+                                reader, uploaded_file, digest, st.session_state.page_texts, pages
+                            ))
+                            groups = []
+                            st.session_state.processed_files = {}
+                            st.session_state.playback = {
+                                digest: {
+                                    "groups": groups,
+                                    "extraction": reader.executor.submit(
+                                        _extract_groups, reader, chunks, groups
+                                    ),
+                                    "voice_id": voice_ids[selected_voice],
+                                    "current": 0,
+                                    "audio": {},
+                                    "pending": {}
+                                }
+                            }
+                            st.rerun()
+                            
+
+                        # Extract text lazily so audio generation starts with the first pages
+                        chunks = reader.iter_chunks(_iter_cached_pages(
+                            reader, uploaded_file, digest, st.session_state.page_texts, pages
+                        ))
+                        first_chunk = next(chunks, None)
+                        if first_chunk is None:
+                            raise Exception("No text could be extracted from this PDF.")
                         
                         # Show text preview
                         with st.expander("Preview extracted text"):
-                            st.text_area("", text[:1000] + "...", height=200)
+                            st.text_area("", first_chunk[:1000] + "...", height=200)
                         
                         # Convert to audio
-                        progress_bar = st.progress(0)
-                        progress_text = st.empty()
-                        
-                        audio_segments = reader.text_to_speech(
-                            text,
-                            selected_voice,
-                            progress_bar
-                        )
+                        with st.status("Converting to audio...") as status:
+                            progress_bar = st.progress(0)
+                            audio_segments = reader.text_to_speech(
+                                itertools.chain([first_chunk], chunks),
+                                voice_ids[selected_voice],
+                                progress_bar,
+                                status
+                            )
+                            status.update(label="Conversion complete", state="complete", expanded=False)
                         
-                        progress_bar.empty()
-                        progress_text.empty()
-                        
-                        # Display audio players and download buttons
-                        st.success(f"Created {len(audio_segments)} audio segments!")
-                        
-                        for i, audio in enumerate(audio_segments, 1):
-                            col1, col2 = st.columns([3, 1])
-                            with col1:
-                                st.audio(audio, format="audio/mp3")
-                            with col2:
-                                st.download_button(
-                                    f"Download Part {i}",
-                                    audio,
-                                    file_name=f"{uploaded_file.name}_part_{i}.mp3",
-                                    mime="audio/mp3"
-                                )
+                        # Keep the result so it survives reruns triggered by the player widgets
+                        st.session_state.playback = {}
+                        st.session_state.processed_files = {
+                            digest: build_audio_zip(uploaded_file.name, audio_segments)
+                        }
                                 
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
                     logger.error(f"Processing error: {str(e)}\n{traceback.format_exc()}")
+            
+            if digest in st.session_state.processed_files:
+                render_audio_segments(uploaded_file.name, st.session_state.processed_files[digest])
+            elif digest in st.session_state.playback:
+                render_playback(reader, uploaded_file.name, st.session_state.playback[digest])
                     
     except Exception as e:
         st.error(f"Error: {str(e)}")